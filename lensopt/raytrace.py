@@ -0,0 +1,368 @@
+# raytrace.py
+import numpy as np
+
+from lensopt.optimizer import OpticalSystemOptimizer
+
+# Schott Sellmeier coefficients (B1, B2, B3, C1, C2, C3), wavelength in um
+GLASS_CATALOG = {
+    "N-BK7": (1.03961212, 0.231792344, 1.01046945, 0.00600069867, 0.0200179144, 103.560653),
+    "N-K5": (1.08511833, 0.199562005, 0.930511663, 0.00661099503, 0.024110866, 111.982777),
+    "N-BAK1": (1.12365662, 0.309276848, 0.881511957, 0.00644742752, 0.0222284402, 107.297751),
+    "N-BAK4": (1.28834642, 0.132817724, 0.945395373, 0.00779980626, 0.0315631177, 105.965875),
+    "N-SK16": (1.34317774, 0.241144399, 0.994317969, 0.00704687339, 0.0229005, 92.7508526),
+    "N-SSK8": (1.44857867, 0.117965926, 1.06937528, 0.00869310149, 0.0421566593, 111.300666),
+    "N-BAF10": (1.5851495, 0.143559385, 1.08521269, 0.00926681282, 0.0424489805, 105.613573),
+    "N-LAK14": (1.50781212, 0.318866829, 1.14287213, 0.00746098727, 0.0242024834, 80.9565165),
+    "N-LAK22": (1.14229781, 0.535138441, 1.04088385, 0.00585778594, 0.0198546147, 100.834017),
+    "N-LAF2": (1.80984227, 0.15729555, 1.0930037, 0.0101711622, 0.0442431765, 100.687748),
+    "N-LASF9": (2.00029547, 0.298926886, 1.80691843, 0.0121426017, 0.0538736236, 156.530829),
+    "F2": (1.34533359, 0.209073176, 0.937357162, 0.00997743871, 0.0470450767, 111.886764),
+    "N-F2": (1.39757037, 0.159201403, 1.2686543, 0.00995906143, 0.0546931752, 119.248346),
+    "N-SF2": (1.47343127, 0.163681849, 1.36920899, 0.0109019098, 0.0585683687, 127.404933),
+    "N-SF5": (1.52481889, 0.187085527, 1.42729015, 0.011254756, 0.0588995392, 129.141675),
+    "N-SF8": (1.55075812, 0.209816918, 1.46205491, 0.0114338344, 0.0582725652, 133.24165),
+    "N-SF6": (1.77931763, 0.338149866, 2.08734474, 0.0133714182, 0.0617533621, 174.01759),
+    "N-SF10": (1.62153902, 0.256287842, 1.64447552, 0.0122241457, 0.0595736775, 147.468793),
+    "N-SF11": (1.73759695, 0.313747346, 1.89878101, 0.013188707, 0.0623068142, 155.23629),
+    "SF11": (1.73848403, 0.311168974, 1.17490871, 0.0136068604, 0.0615960463, 121.922711),
+    "N-SF57": (1.87543831, 0.37375749, 2.30001797, 0.0141749518, 0.0640509927, 177.389795),
+    "F_SILICA": (0.6961663, 0.4079426, 0.8974794, 0.004679148, 0.01351206, 97.934003),
+}
+
+
+class LocalSurfaceCell:
+    """Stand-in for a ZOS-API thickness cell."""
+    def __init__(self, surface):
+        self.surface = surface
+
+    def MakeSolveVariable(self):
+        self.surface.is_variable = True
+
+
+class LocalSurface:
+    """Stand-in for a ZOS-API LDE surface (standard spherical surface)."""
+    def __init__(self, thickness=0.0, is_stop=False):
+        self.Radius = float('inf')
+        self.Thickness = thickness
+        self.Material = ""
+        self.SemiDiameter = 0.0
+        self.ThicknessCell = LocalSurfaceCell(self)
+        self.is_stop = is_stop
+        self.is_variable = False
+
+
+class LocalLensDataEditor:
+    """Minimal sequential lens data editor mirroring a new OpticStudio system (OBJ, STO, IMA)."""
+    def __init__(self):
+        self.surfaces = [LocalSurface(float('inf')), LocalSurface(is_stop=True), LocalSurface()]
+
+    @property
+    def NumberOfSurfaces(self):
+        return len(self.surfaces)
+
+    def InsertNewSurfaceAt(self, index):
+        surf = LocalSurface()
+        self.surfaces.insert(index, surf)
+        return surf
+
+    def GetSurfaceAt(self, index):
+        if 0 <= index < len(self.surfaces):
+            return self.surfaces[index]
+        return None
+
+
+class LocalOpticalSystemOptimizer(OpticalSystemOptimizer):
+    """
+    OpticStudio-free optimizer backend.
+
+    Reuses the surface layout of OpticalSystemOptimizer on a local lens data
+    editor and traces real rays through spherical surfaces with NumPy,
+    vectorized over fields, wavelengths and pupil rays.
+    """
+    WAVELENGTHS = (0.4861327, 0.5875618, 0.6562725)  # F, d, C (um)
+    PRIMARY_WAVELENGTH = 1
+    FIELD_HEIGHTS = (0.0, 11.0, 21.6)  # Real image height (mm)
+    SPOT_RINGS = 6
+    AIR_MIN = 0.5
+    AIR_MAX = 1000.0
+
+    def __init__(self, lens_count=3, rms_threshold=300, aperture=10, num_cores=8,
+                 max_iterations=30, ap_position=1, is_macro=False, glass_catalog=None):
+        super().__init__(None, None, lens_count=lens_count, rms_threshold=rms_threshold,
+                         aperture=aperture, num_cores=num_cores, max_iterations=max_iterations,
+                         ap_position=ap_position, is_macro=is_macro)
+        self.glass_catalog = dict(GLASS_CATALOG)
+        if glass_catalog:
+            self.glass_catalog.update({k.upper(): v for k, v in glass_catalog.items()})
+        self.pupil_x, self.pupil_y = self._hexapolar_pupil(self.SPOT_RINGS)
+
+    def _initialize_system(self):
+        """Initialize local optical system."""
+        self.TheLDE = LocalLensDataEditor()
+
+    def _configure_aperture_and_field(self, type_code):
+        """Configure aperture type; fields and wavelengths are fixed class constants."""
+        if type_code not in (1, 2, 3):
+            raise ValueError(f"Unsupported aperture type: {type_code}")
+        self.aperture_type = type_code
+
+    def _optimize_system(self):
+        """Run quick focus followed by damped least squares on variable thicknesses."""
+        self._build_system()
+        self._quick_focus()
+        self._local_optimization()
+        # Write optimized thicknesses back to the lens data editor
+        for i, surf in enumerate(self.TheLDE.surfaces):
+            surf.Thickness = float(self.thickness[i])
+
+    def _evaluate_results(self):
+        """Evaluate polychromatic RMS spot radius (um, chief ray reference) per field."""
+        self._build_system()
+        try:
+            x, y = self._trace_spots(self.thickness)[:2]
+        except ValueError:
+            return float('inf')
+
+        # Reference each field to the chief ray of the primary wavelength
+        dx = x - x[:, self.PRIMARY_WAVELENGTH, :1][:, None]
+        dy = y - y[:, self.PRIMARY_WAVELENGTH, :1][:, None]
+        rms_values = np.sqrt(np.mean(dx ** 2 + dy ** 2, axis=(1, 2))) * 1000.0
+        if not np.all(np.isfinite(rms_values)):
+            return float('inf')
+        rms_values = rms_values.tolist()
+
+        # Check for valid RMS values
+        if 0 in rms_values:
+            return float('inf')
+
+        # Calculate weighted RMS (more weight to first field)
+        weighted_rms = sum((2.5 - i) * rms for i, rms in enumerate(rms_values))
+        return weighted_rms
+
+    def _build_system(self):
+        """Convert lens data editor surfaces to curvature, thickness and index arrays."""
+        surfaces = self.TheLDE.surfaces
+        radii = np.array([s.Radius for s in surfaces], dtype=float)
+        with np.errstate(divide='ignore'):
+            self.curvature = np.where(np.isfinite(radii) & (radii != 0), 1.0 / radii, 0.0)
+        self.thickness = np.array([s.Thickness for s in surfaces], dtype=float)
+        self.index = np.array([self._refractive_index(s.Material) for s in surfaces])
+        self.stop_index = next(i for i, s in enumerate(surfaces) if s.is_stop)
+        self.variables = [i for i, s in enumerate(surfaces) if s.is_variable]
+
+    def _refractive_index(self, material):
+        """Refractive index of a material at each system wavelength."""
+        name = (material or "").strip().upper()
+        if name in ("", "AIR"):
+            return np.ones(len(self.WAVELENGTHS))
+        if name not in self.glass_catalog:
+            raise ValueError(f"Unknown material: {material}")
+        b1, b2, b3, c1, c2, c3 = self.glass_catalog[name]
+        w2 = np.asarray(self.WAVELENGTHS) ** 2
+        return np.sqrt(1 + b1 * w2 / (w2 - c1) + b2 * w2 / (w2 - c2) + b3 * w2 / (w2 - c3))
+
+    @staticmethod
+    def _hexapolar_pupil(rings):
+        """Hexapolar pupil sampling with the chief ray first."""
+        px, py = [0.0], [0.0]
+        for ring in range(1, rings + 1):
+            theta = 2 * np.pi * np.arange(6 * ring) / (6 * ring)
+            px.extend(ring / rings * np.sin(theta))
+            py.extend(ring / rings * np.cos(theta))
+        return np.array(px), np.array(py)
+
+    def _paraxial_matrix(self, thickness, start, end):
+        """Paraxial (y, nu) transfer matrix from the vertex of surface `start` to that of `end`."""
+        n = self.index[:, self.PRIMARY_WAVELENGTH]
+        matrix = np.eye(2)
+        for k in range(start, end):
+            matrix = np.array([[1.0, 0.0], [-(n[k] - n[k - 1]) * self.curvature[k], 1.0]]) @ matrix
+            matrix = np.array([[1.0, thickness[k] / n[k]], [0.0, 1.0]]) @ matrix
+        return matrix
+
+    def _entrance_pupil(self, thickness):
+        """Paraxial entrance pupil position (from surface 1) and diameter."""
+        matrix = self._paraxial_matrix(thickness, 1, self.stop_index)
+        if abs(matrix[0, 0]) < 1e-12:
+            raise ValueError("Entrance pupil is at infinity")
+        pupil_z = matrix[0, 1] / matrix[0, 0]
+
+        if self.aperture_type == 1:
+            diameter = self.aperture
+        elif self.aperture_type == 2:
+            power = -self._paraxial_matrix(thickness, 1, len(thickness) - 1)[1, 0]
+            if power == 0:
+                raise ValueError("Afocal system has no image space F/#")
+            diameter = abs(1.0 / power) / self.aperture
+        else:
+            if not np.isfinite(thickness[0]):
+                raise ValueError("Object space NA requires a finite object distance")
+            diameter = 2 * (thickness[0] + pupil_z) * np.tan(np.arcsin(self.aperture))
+        return pupil_z, abs(diameter)
+
+    def _launch_rays(self, thickness, field, pupil_x, pupil_y):
+        """Build object space rays (in surface 1 coordinates) for fields x pupil points."""
+        pupil_z, diameter = self._entrance_pupil(thickness)
+        field = np.asarray(field, dtype=float)[:, None]
+        x = np.zeros_like(field) + 0.5 * diameter * pupil_x
+        y = np.zeros_like(field) + 0.5 * diameter * pupil_y
+        z = np.full_like(x, pupil_z)
+
+        if np.isfinite(thickness[0]):
+            # Finite object: field is the object height, rays aimed at the paraxial pupil
+            dx, dy, dz = x, y - field, z + thickness[0]
+            x, y, z = np.zeros_like(x), field + np.zeros_like(y), np.full_like(x, -thickness[0])
+        else:
+            # Infinite object: field is the tangent of the chief ray angle
+            dx, dy, dz = np.zeros_like(x), field + np.zeros_like(y), np.ones_like(x)
+        norm = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+        return (x, y, z), (dx / norm, dy / norm, dz / norm)
+
+    def _trace(self, thickness, position, direction, index):
+        """Trace rays from surface 1 to the image surface; arrays broadcast over (field, wave, ray)."""
+        x, y, z = position
+        L, M, N = direction
+        last = len(thickness) - 1
+        for k in range(1, last):
+            if k > 1:
+                z = z - thickness[k - 1]
+            c = self.curvature[k]
+
+            # Intersect the sphere c(x^2 + y^2 + z^2) - 2z = 0
+            b = c * (x * L + y * M + z * N) - N
+            f = c * (x * x + y * y + z * z) - 2 * z
+            with np.errstate(invalid='ignore', divide='ignore'):
+                s = f / (-b + np.sqrt(b * b - c * f))
+            x, y, z = x + s * L, y + s * M, z + s * N
+
+            # Refract at the surface normal
+            n1, n2 = index[k - 1][:, None], index[k][:, None]
+            if np.all(n1 == n2):
+                continue
+            nx, ny, nz = -c * x, -c * y, 1 - c * z
+            mu = n1 / n2
+            cos_i = L * nx + M * ny + N * nz
+            with np.errstate(invalid='ignore'):
+                cos_r = np.sqrt(1 - mu ** 2 * (1 - cos_i ** 2))
+            g = cos_r - mu * cos_i
+            L, M, N = mu * L + g * nx, mu * M + g * ny, mu * N + g * nz
+
+        # Transfer to the image plane
+        z = z - thickness[last - 1]
+        s = -z / N
+        return x + s * L, y + s * M, L / N, M / N
+
+    def _chief_ray_height(self, thickness, field):
+        """Real image height of the primary wavelength chief ray for each field."""
+        position, direction = self._launch_rays(thickness, field, np.zeros(1), np.zeros(1))
+        position = [p[:, None] for p in position]
+        direction = [d[:, None] for d in direction]
+        index = self.index[:, [self.PRIMARY_WAVELENGTH]]
+        return self._trace(thickness, position, direction, index)[1][:, 0, 0]
+
+    def _solve_fields(self, thickness):
+        """Find object space field values that land the chief ray at the real image heights."""
+        targets = np.asarray(self.FIELD_HEIGHTS)
+        step = 1e-4 if not np.isfinite(thickness[0]) else 1e-3
+        slope = self._chief_ray_height(thickness, [step])[0] / step
+        field = targets / slope
+        for _ in range(20):
+            height = self._chief_ray_height(thickness, field)
+            error = targets - height
+            if np.all(np.abs(error) < 1e-7):
+                return field
+            derivative = (self._chief_ray_height(thickness, field + step) - height) / step
+            field = field + error / derivative
+            if not np.all(np.isfinite(field)):
+                break
+        raise ValueError("Unable to aim chief ray at the real image height")
+
+    def _trace_spots(self, thickness):
+        """Trace the spot pupil sampling for every field and wavelength."""
+        field = self._solve_fields(thickness)
+        position, direction = self._launch_rays(thickness, field, self.pupil_x, self.pupil_y)
+        position = [p[:, None] for p in position]
+        direction = [d[:, None] for d in direction]
+        return self._trace(thickness, position, direction, self.index)
+
+    def _quick_focus(self, passes=3):
+        """Adjust the image distance to minimize the centroid referenced RMS spot radius."""
+        for _ in range(passes):
+            x, y, tx, ty = self._trace_spots(self.thickness)
+            # Spot deviation is linear in defocus, so the best focus is a least squares shift
+            a = np.concatenate([x - x.mean(axis=(1, 2), keepdims=True), y - y.mean(axis=(1, 2), keepdims=True)])
+            b = np.concatenate([tx - tx.mean(axis=(1, 2), keepdims=True), ty - ty.mean(axis=(1, 2), keepdims=True)])
+            shift = -np.sum(a * b) / np.sum(b * b)
+            if not np.isfinite(shift):
+                raise ValueError("Quick focus failed")
+            self.thickness[-2] += shift
+
+    def _residuals(self, values):
+        """Centroid referenced spot residuals for a set of variable thicknesses."""
+        thickness = self.thickness.copy()
+        thickness[self.variables] = values
+        try:
+            x, y = self._trace_spots(thickness)[:2]
+        except ValueError:
+            return None
+        residuals = np.concatenate([
+            (x - x.mean(axis=(1, 2), keepdims=True)).ravel(),
+            (y - y.mean(axis=(1, 2), keepdims=True)).ravel(),
+        ])
+        if not np.all(np.isfinite(residuals)):
+            return None
+        return residuals
+
+    def _local_optimization(self):
+        """Damped least squares on variable air thicknesses within the air boundaries."""
+        if not self.variables:
+            return
+        values = np.clip(self.thickness[self.variables], self.AIR_MIN, self.AIR_MAX)
+        residuals = self._residuals(values)
+        if residuals is None:
+            return
+        merit = residuals @ residuals
+        damping = 1e-3
+
+        for _ in range(self.max_iterations):
+            # Forward difference Jacobian
+            jacobian = np.empty((residuals.size, values.size))
+            for j in range(values.size):
+                delta = 1e-5 * max(1.0, abs(values[j]))
+                trial = values.copy()
+                trial[j] += delta
+                trial_residuals = self._residuals(trial)
+                if trial_residuals is None:
+                    trial[j] -= 2 * delta
+                    delta = -delta
+                    trial_residuals = self._residuals(trial)
+                    if trial_residuals is None:
+                        return self._set_variables(values)
+                jacobian[:, j] = (trial_residuals - residuals) / delta
+
+            normal = jacobian.T @ jacobian
+            gradient = jacobian.T @ residuals
+            improved = False
+            while damping < 1e8:
+                step = np.linalg.solve(normal + damping * np.diag(np.diag(normal) + 1e-12), -gradient)
+                trial = np.clip(values + step, self.AIR_MIN, self.AIR_MAX)
+                trial_residuals = self._residuals(trial)
+                if trial_residuals is not None and trial_residuals @ trial_residuals < merit:
+                    improved = True
+                    break
+                damping *= 10
+
+            if not improved:
+                break
+            converged = merit - trial_residuals @ trial_residuals < 1e-6 * merit
+            values, residuals = trial, trial_residuals
+            merit = residuals @ residuals
+            damping = max(damping / 10, 1e-9)
+            if converged:
+                break
+
+        self._set_variables(values)
+
+    def _set_variables(self, values):
+        """Store variable thicknesses back into the system thickness array."""
+        self.thickness[self.variables] = values